@@ -1,11 +1,36 @@
+import argparse
 import csv
+import math
+import string
+import sys
 from typing import List, Dict
-from PIL import Image, ImageDraw, ImageFont, ImageColor
+from PIL import Image, ImageDraw, ImageFont, ImageColor, ImageOps
 from textwrap import wrap
+import numpy as np
 from typing import List, Dict
 import random
+from functools import lru_cache
+from multiprocessing import Pool, cpu_count
+
+# Constants for card size and resolution
+CARD_WIDTH, CARD_HEIGHT = 750+75, 1050+75  # Poker card size at 300 DPI (2.5x3.5 inches +0.25 inch boarder)
+DPI = 300
+MARGIN = int(0.25 * DPI)  # Left and right margins
+MAX_TEXT_WIDTH = CARD_WIDTH - 2 * MARGIN  # Maximum width for a line of text
+
+# Fonts loaded so far, keyed by (font_path, font_size)
+_FONT_CACHE: Dict[tuple, ImageFont.FreeTypeFont] = {}
+
+# Layout features for pool workers, set once per process by _init_worker()
+_WORKER_FEATURES: List['ImageFeature'] = []
+
+# Blank white card images, keyed by (width, height)
+_BLANK_CARDS: Dict[tuple, Image.Image] = {}
 
 class ImageFeature:
+    __slots__ = ('font', 'font_size', 'text_color', 'justification', 'vertical_pos', 'element_name', 'rotation',
+                 'justification_lower', 'font_path', 'text_color_rgba', 'y_center')
+
     def __init__(self, font: str, font_size: int, text_color: str, 
                  justification: str, vertical_pos: float, element_name: str, rotation: float):
         self.font = font
@@ -16,6 +41,12 @@ class ImageFeature:
         self.element_name = element_name
         self.rotation = rotation
 
+        # Card-independent values, computed once instead of for every card
+        self.justification_lower = justification.lower()
+        self.font_path = f"C:\\Windows\\Fonts\\{font}.ttf"
+        self.text_color_rgba = hex_to_rgba(text_color, 255)
+        self.y_center = vertical_pos * CARD_HEIGHT
+
     def __repr__(self):
         return (f"ImageFeature(font={self.font}, font_size={self.font_size}, text_color={self.text_color}, "
                 f"justification={self.justification}, vertical_pos={self.vertical_pos}, element_name={self.element_name}, rotation={self.rotation})")
@@ -23,16 +54,24 @@ class ImageFeature:
 def read_csv_to_features(file_path: str) -> List[ImageFeature]:
     features = []
     with open(file_path, mode='r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
+        reader = csv.reader(csvfile)
+        header = next(reader)
+        column = {name: i for i, name in enumerate(header)}
+        font_i, font_size_i, text_color_i, justification_i, vertical_pos_i, element_name_i, rotation_i = (
+            column[name] for name in
+            ('font', 'font_size', 'text_color', 'justification', 'vertical_pos', 'element_name', 'rotation')
+        )
         for row in reader:
+            if not row:
+                continue  # Skip blank lines, as DictReader does
             feature = ImageFeature(
-                font=row['font'],
-                font_size=int(row['font_size']),
-                text_color=row['text_color'],
-                justification=row['justification'],
-                vertical_pos=float(row['vertical_pos']),
-                element_name=row['element_name'],
-                rotation=row['rotation']
+                font=row[font_i],
+                font_size=int(row[font_size_i]),
+                text_color=row[text_color_i],
+                justification=row[justification_i],
+                vertical_pos=float(row[vertical_pos_i]),
+                element_name=row[element_name_i],
+                rotation=row[rotation_i]
             )
             features.append(feature)
     return features
@@ -40,9 +79,12 @@ def read_csv_to_features(file_path: str) -> List[ImageFeature]:
 def read_csv_to_cards(file_path: str) -> List[Dict[str, str]]:
     cards = []
     with open(file_path, mode='r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
+        reader = csv.reader(csvfile)
+        # Intern the column names so element_name lookups hit identical keys
+        header = [sys.intern(name) for name in next(reader)]
         for row in reader:
-            cards.append(row)
+            if row:
+                cards.append(dict(zip(header, row)))
     return cards
 
 def create_transparent_mask(image: Image) -> Image:
@@ -60,7 +102,7 @@ def create_transparent_mask(image: Image) -> Image:
     grayscale = image.convert("L")
 
     # Invert the grayscale image (white becomes black, and black becomes white)
-    inverted_grayscale = Image.eval(grayscale, lambda x: 255 - x)
+    inverted_grayscale = ImageOps.invert(grayscale)
 
     # Return the mask (inverted grayscale)
     return inverted_grayscale
@@ -73,13 +115,115 @@ def hex_to_rgba(hex_color: str, alpha: int = 255) -> tuple:
     :param alpha: Alpha value for transparency (default is 255 for fully opaque).
     :return: A tuple (R, G, B, A).
     """
-    # Convert the hex color to an RGB tuple
+    # Fast path for the common '#RRGGBB' form
+    if len(hex_color) == 7 and hex_color[0] == '#' and all(c in string.hexdigits for c in hex_color[1:]):
+        value = int(hex_color[1:], 16)
+        return ((value >> 16) & 0xff, (value >> 8) & 0xff, value & 0xff, alpha)
+
+    # Anything else (short hex, color names, ...) goes through PIL
     rgb = ImageColor.getrgb(hex_color)
     
     # Add the alpha value for transparency
     return (rgb[0], rgb[1], rgb[2], alpha)
 
-def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, draw: ImageDraw.Draw) -> List[str]:
+def load_fonts(features: List[ImageFeature], warn: bool = True) -> None:
+    """
+    Load every (font, size) used by the features into the font cache.
+
+    Fonts that cannot be opened are replaced by PIL's default font, with a
+    warning printed once per missing font rather than on every card.
+
+    :param features: The features whose fonts should be loaded.
+    :param warn: Print a warning for fonts that cannot be opened (default is True).
+    """
+    missing = set()
+    for feature in features:
+        key = (feature.font_path, feature.font_size)
+        if key in _FONT_CACHE:
+            continue
+        try:
+            _FONT_CACHE[key] = ImageFont.truetype(feature.font_path, feature.font_size)
+        except IOError:
+            if warn and feature.font_path not in missing:
+                missing.add(feature.font_path)
+                print(f"Warning: could not load font {feature.font_path}, using the default font")
+            _FONT_CACHE[key] = ImageFont.load_default()
+
+def get_blank_card(width: int, height: int) -> Image.Image:
+    """
+    Return a fresh white RGB card, copied from a template built once per size.
+
+    :param width: Card width in pixels.
+    :param height: Card height in pixels.
+    :return: A new image the caller is free to draw on.
+    """
+    key = (width, height)
+    blank = _BLANK_CARDS.get(key)
+    if blank is None:
+        blank = Image.new("RGB", key, (255, 255, 255))
+        _BLANK_CARDS[key] = blank
+    return blank.copy()
+
+# Kept small: each entry is a mask up to a full line wide, and most lines never repeat
+@lru_cache(maxsize=256)
+def render_text_mask(font_path: str, font_size: int, text: str, anchor: str) -> tuple:
+    """
+    Rasterize a line of text into a grayscale coverage mask, memoized so text
+    repeated across cards is only rendered once.
+
+    The font must already be in the font cache (see load_fonts).
+
+    :param font_path: Path of the cached font.
+    :param font_size: Size of the cached font.
+    :param text: The line of text to render.
+    :param anchor: PIL text anchor the offsets are relative to (e.g. 'la').
+    :return: A tuple (mask, left, top) where left/top is the mask's offset from
+             the anchor point, or (None, 0, 0) if the text has no ink.
+    """
+    font = _FONT_CACHE[(font_path, font_size)]
+    left, top, right, bottom = font.getbbox(text, anchor=anchor)
+    if right <= left or bottom <= top:
+        return None, 0, 0
+    mask = Image.new("L", (right - left, bottom - top), 0)
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=font, anchor=anchor)
+    return mask, left, top
+
+def snap_text_coordinate(value: float) -> int:
+    """
+    Round a text position to a whole pixel the same way draw.text does.
+
+    Pillow passes the fractional part to FreeType in 26.6 fixed point, so an
+    exact .5 rounds down and anything from .5 + 1/128 up rounds up.
+
+    :param value: The (possibly fractional) coordinate.
+    :return: The pixel coordinate draw.text would place the text at.
+    """
+    whole = int(value)
+    fraction = value - whole
+    fraction_26_6 = int(math.copysign(math.floor(abs(fraction) * 64 + 0.5), fraction))
+    return whole - (32 - fraction_26_6) // 64
+
+def draw_text_line(image: Image.Image, xy: tuple, text: str, font_path: str, font_size: int,
+                   fill: tuple, anchor: str) -> None:
+    """
+    Draw one line of text like draw.text, but from the cached glyph mask.
+
+    :param image: The image to draw on.
+    :param xy: The anchor point, which may be fractional.
+    :param text: The line of text.
+    :param font_path: Path of the cached font.
+    :param font_size: Size of the cached font.
+    :param fill: The text color.
+    :param anchor: PIL text anchor (e.g. 'la').
+    """
+    mask, left, top = render_text_mask(font_path, font_size, text, anchor)
+    if mask is None:
+        return
+    box_x = snap_text_coordinate(xy[0]) + left
+    box_y = snap_text_coordinate(xy[1]) + top
+    image.paste(fill, (box_x, box_y, box_x + mask.width, box_y + mask.height), mask)
+
+def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int) -> List[str]:
     """
     Wraps the text to fit within a specified width.
 
@@ -87,7 +231,6 @@ def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, draw: Ima
         text (str): The text to be wrapped.
         font (ImageFont.FreeTypeFont): The font used to measure text size.
         max_width (int): The maximum width allowed for the text.
-        draw (ImageDraw.Draw): The drawing context (not used directly here but kept for consistency).
 
     Returns:
         List[str]: A list of text lines wrapped to fit within max_width.
@@ -95,139 +238,123 @@ def wrap_text(text: str, font: ImageFont.FreeTypeFont, max_width: int, draw: Ima
     words = text.split()
     wrapped_lines = []
     current_line = []
+    current_width = 0
+    space_width = font.getlength(' ')
 
     for word in words:
-        test_line = ' '.join(current_line + [word])
-        text_bbox = draw.textbbox((0, 0), test_line, font=font)  # Measure text bbox
-        text_width = text_bbox[2] - text_bbox[0]  # Calculate the width
-        if text_width <= max_width:
+        # Measure each word once and keep a running width for the line
+        word_width = font.getlength(word)
+        added_width = word_width if not current_line else space_width + word_width
+        if current_width + added_width <= max_width:
             current_line.append(word)
+            current_width += added_width
         else:
             wrapped_lines.append(' '.join(current_line))
             current_line = [word]
+            current_width = word_width
 
     if current_line:
         wrapped_lines.append(' '.join(current_line))
 
     return wrapped_lines
 
+def _gradient_axis(length: int, colors: list) -> np.ndarray:
+    # Blend three colors (wrapping back to the first) along one axis, with the
+    # same arithmetic as the per-pixel version so the integer results match exactly
+    start = np.array(colors, dtype=np.float64)
+    end = np.roll(start, -1, axis=0)
+    t = np.arange(length) / length
+    seg = np.select([t < 1/3, t < 2/3], [0, 1], 2)
+    seg_t = np.select([t < 1/3, t < 2/3], [t * 3, (t - 1/3) * 3], (t - 2/3) * 3)[:, None]
+    return (start[seg] + (end[seg] - start[seg]) * seg_t).astype(np.int32)
+
 def generate_gradient(width, height):
     # Generate three random colors for horizontal and vertical gradients
     horizontal_colors = [tuple(random.randint(128, 255) for _ in range(3)) for _ in range(3)]
     vertical_colors = [tuple(random.randint(128, 255) for _ in range(3)) for _ in range(3)]
 
-    # Create a new image
-    img = Image.new("RGB", (width, height))
-    pixels = img.load()
-
-    for x in range(width):
-        for y in range(height):
-            # Horizontal interpolation
-            t_x = x / width
-            if t_x < 1/3:
-                h_c1, h_c2 = horizontal_colors[0], horizontal_colors[1]
-                h_t = t_x * 3
-            elif t_x < 2/3:
-                h_c1, h_c2 = horizontal_colors[1], horizontal_colors[2]
-                h_t = (t_x - 1/3) * 3
-            else:
-                h_c1, h_c2 = horizontal_colors[2], horizontal_colors[0]
-                h_t = (t_x - 2/3) * 3
-
-            h_r = int(h_c1[0] + (h_c2[0] - h_c1[0]) * h_t)
-            h_g = int(h_c1[1] + (h_c2[1] - h_c1[1]) * h_t)
-            h_b = int(h_c1[2] + (h_c2[2] - h_c1[2]) * h_t)
-
-            # Vertical interpolation
-            t_y = y / height
-            if t_y < 1/3:
-                v_c1, v_c2 = vertical_colors[0], vertical_colors[1]
-                v_t = t_y * 3
-            elif t_y < 2/3:
-                v_c1, v_c2 = vertical_colors[1], vertical_colors[2]
-                v_t = (t_y - 1/3) * 3
-            else:
-                v_c1, v_c2 = vertical_colors[2], vertical_colors[0]
-                v_t = (t_y - 2/3) * 3
-
-            v_r = int(v_c1[0] + (v_c2[0] - v_c1[0]) * v_t)
-            v_g = int(v_c1[1] + (v_c2[1] - v_c1[1]) * v_t)
-            v_b = int(v_c1[2] + (v_c2[2] - v_c1[2]) * v_t)
-
-            # Combine horizontal and vertical gradients
-            r = min(255, int((h_r + v_r) / 2))
-            g = min(255, int((h_g + v_g) / 2))
-            b = min(255, int((h_b + v_b) / 2))
-
-            # Set the pixel color
-            pixels[x, y] = (r, g, b)
-
-    return img
-
-
-def create_card_image(card: Dict[str, str], features: List['ImageFeature'], output_path: str):
-    # Constants for card size and resolution
-    CARD_WIDTH, CARD_HEIGHT = 750+75, 1050+75  # Poker card size at 300 DPI (2.5x3.5 inches +0.25 inch boarder)
-    DPI = 300
-    MARGIN = int(0.25 * DPI)  # Left and right margins
+    # Interpolated colors for every column and for every row
+    h = _gradient_axis(width, horizontal_colors)
+    v = _gradient_axis(height, vertical_colors)
+
+    # Combine horizontal and vertical gradients via broadcasting to (height, width, 3)
+    rgb = np.minimum(255, (h[None, :, :] + v[:, None, :]) // 2).astype(np.uint8)
 
+    return Image.fromarray(rgb, "RGB")
+
+
+def create_card_image(card: Dict[str, str], features: List['ImageFeature'], output_path: str,
+                      image_format: str = "PNG"):
     # Generate gradient background
-    # gradient_background = generate_gradient(CARD_WIDTH, CARD_HEIGHT)
-    # image = gradient_background.convert("RGBA")  # Ensure the background has an alpha channel
-    image = Image.new("RGBA", (CARD_WIDTH, CARD_HEIGHT), "white")
-    draw = ImageDraw.Draw(image)
+    # image = generate_gradient(CARD_WIDTH, CARD_HEIGHT)  # Already RGB, like the blank card
+    image = get_blank_card(CARD_WIDTH, CARD_HEIGHT)
 
     for feature in features:
         text = card.get(feature.element_name, "")
         if not text:
             continue
 
-        # Load font
-        font_path = f"C:\\Windows\\Fonts\\{feature.font}.ttf"
-        try:
-            font = ImageFont.truetype(font_path, feature.font_size)
-        except IOError:
-            font = ImageFont.load_default()
-
-        # Determine the maximum width for the text area
-        max_width = CARD_WIDTH - 2 * MARGIN
+        # Fonts are loaded up front by load_fonts()
+        font = _FONT_CACHE[(feature.font_path, feature.font_size)]
 
         # Wrap the text to fit the width
-        wrapped_lines = wrap_text(text, font, max_width, draw)
+        wrapped_lines = wrap_text(text, font, MAX_TEXT_WIDTH)
 
-        # Calculate the maximum text height (consistent line spacing)
-        max_text_height = max(
-            draw.textbbox((0, 0), line, font=font)[3] - draw.textbbox((0, 0), line, font=font)[1]
-            for line in wrapped_lines
-        )
+        # Line height comes from the font metrics (consistent line spacing)
+        ascent, descent = font.getmetrics()
+        max_text_height = ascent + descent
 
         # Calculate initial position
         total_text_height = len(wrapped_lines) * max_text_height * 1.1  # Include spacing factor (1.1)
-        y_start = int(feature.vertical_pos * CARD_HEIGHT - total_text_height / 2)
+        y_start = int(feature.y_center - total_text_height / 2)
         y = y_start
 
-        for line in wrapped_lines:
-            text_bbox = draw.textbbox((0, 0), line, font=font)
-            text_width = text_bbox[2] - text_bbox[0]
-            justification = feature.justification.lower()
-            if justification == "center":
-                x = (CARD_WIDTH - text_width) // 2
-            elif justification == "right":
-                x = CARD_WIDTH - text_width - MARGIN
-            else:
-                x = MARGIN  # Assume left justified
+        # Let PIL place each line relative to an anchor point instead of measuring it first
+        if feature.justification_lower == "center":
+            x, anchor = CARD_WIDTH // 2, "ma"
+        elif feature.justification_lower == "right":
+            x, anchor = CARD_WIDTH - MARGIN, "ra"
+        else:
+            x, anchor = MARGIN, "la"  # Assume left justified
 
+        for line in wrapped_lines:
             # Draw the text line
-            draw.text((x, y), line, fill=feature.text_color, font=font)
+            draw_text_line(image, (x, y), line, feature.font_path, feature.font_size, feature.text_color_rgba, anchor)
 
             # Increment y by the maximum line height plus spacing
             y += max_text_height * 1.1
 
-    # Save the image
-    image.save(output_path, "PNG")
+    # Save the image, with a fast zlib level for PNG
+    if image_format == "JPEG":
+        image.save(output_path, "JPEG", quality=92)
+    else:
+        image.save(output_path, "PNG", compress_level=1)
+
+
+def _init_worker(features: List[ImageFeature]) -> None:
+    # Keep the features in the worker so jobs don't have to carry them.
+    # Workers load the fonts too, in case they do not inherit the parent's cache;
+    # the parent already printed any warnings, so they load quietly.
+    global _WORKER_FEATURES
+    _WORKER_FEATURES = features
+    load_fonts(features, warn=False)
+
+
+def _render_one(job: tuple) -> str:
+    # Top-level so it can be pickled for the worker pool
+    card, output_path, image_format = job
+    create_card_image(card, _WORKER_FEATURES, output_path, image_format)
+    return output_path
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate card images from layout.csv and cards.csv.")
+    parser.add_argument("--format", choices=["png", "jpeg"], default="png",
+                        help="Output image format (default: png). JPEG is faster to encode but lossy.")
+    args = parser.parse_args()
+    image_format = args.format.upper()
+    extension = "jpg" if image_format == "JPEG" else "png"
+
     features_file_path = "layout.csv"
     cards_file_path = "cards.csv"
 
@@ -239,11 +366,14 @@ def main():
     print("\nCards:")
     print(cards)
 
-    # Generate images for each card
-    for i, card in enumerate(cards):
-        output_path = f"card_{i + 1}.png"
-        create_card_image(card, features, output_path)
-        print(f"Card image saved to {output_path}")
+    load_fonts(features)
+
+    # Generate images for each card, spread across all CPU cores
+    # The features are sent to each worker once, not with every card
+    jobs = [(card, f"card_{i + 1}.{extension}", image_format) for i, card in enumerate(cards)]
+    with Pool(cpu_count(), initializer=_init_worker, initargs=(features,)) as pool:
+        for output_path in pool.imap_unordered(_render_one, jobs, chunksize=4):
+            print(f"Card image saved to {output_path}")
 
 if __name__ == "__main__":
     main()
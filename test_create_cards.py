@@ -0,0 +1,35 @@
+import pytest
+from PIL import Image, ImageChops, ImageDraw, ImageFont
+
+import create_cards
+
+
+@pytest.fixture
+def cached_font():
+    # Register a FreeType font under a fake path, the way load_fonts() would,
+    # and remove it and any masks rendered with it afterwards
+    font_path, font_size = "test-font.ttf", 40
+    font = ImageFont.load_default(size=font_size)
+    create_cards._FONT_CACHE[(font_path, font_size)] = font
+    create_cards.render_text_mask.cache_clear()
+    try:
+        yield font_path, font_size, font
+    finally:
+        create_cards._FONT_CACHE.pop((font_path, font_size), None)
+        create_cards.render_text_mask.cache_clear()
+
+
+def test_draw_text_line_matches_draw_text_at_fractional_y(cached_font):
+    font_path, font_size, font = cached_font
+    fill = create_cards.hex_to_rgba("#433650")
+
+    # Cover a whole pixel in 1/128 steps plus the values either side of the .5 rounding boundary
+    fractions = [k / 128 for k in range(128)] + [0.5 + 1e-6, 0.501, 0.999]
+    for anchor, x in (("la", 75), ("ma", 412), ("ra", 750)):
+        for fraction in fractions:
+            y = 100 + fraction
+            expected = Image.new("RGB", (825, 300), "white")
+            ImageDraw.Draw(expected).text((x, y), "Gentle Breeze gy", fill=fill, font=font, anchor=anchor)
+            actual = Image.new("RGB", (825, 300), "white")
+            create_cards.draw_text_line(actual, (x, y), "Gentle Breeze gy", font_path, font_size, fill, anchor)
+            assert ImageChops.difference(expected, actual).getbbox() is None, (anchor, y)